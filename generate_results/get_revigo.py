@@ -1,9 +1,16 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
 import time
+import random
 import argparse
 import sys
 import logging
-import pandas as pd
+import hashlib
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 logging.basicConfig(
@@ -14,8 +21,20 @@ logging.basicConfig(
 
 BASE_DIR = Path(__file__).parent.parent
 BASE_URL = "http://revigo.irb.hr/"
+START_URL = f"{BASE_URL}StartJob"
+QUERY_URL = f"{BASE_URL}QueryJob"
+RESULTS_URL = f"{BASE_URL}Results"
+CACHE_DIR = BASE_DIR / ".revigo_cache"
 HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
 
+# Shared session keeps the connection to REVIGO alive across submit -> poll -> fetch
+# (retries are handled explicitly in submit_revigo / wait_for_completion)
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=0))
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+atexit.register(SESSION.close)
+
 # Maps numeric IDs to readable names:
 NAMESPACE = {
     '1': 'biological_process',
@@ -23,6 +42,11 @@ NAMESPACE = {
     '3': 'molecular_function'
 }
 RESULT_TYPES = ["jTable", "jScatterplot", "jCytoscape"]
+MAX_BACKOFF = 300       # cap for submission retry delay (s)
+POLL_START = 0.05      # first job status polling interval (s)
+POLL_FACTOR = 1.3      # polling interval growth per attempt
+POLL_MAX = 5.0         # cap for job status polling interval (s)
+JOB_ERROR_MSG = 'the job has an errors, no data available'
 
 def format_time(seconds):
     mins, sec = divmod(seconds, 60)
@@ -41,21 +65,47 @@ def load_csv(file_path: str) -> str:
         sys.exit(1)
 
     try:
-        terms_with_score = pd.read_csv(file_path, sep='\t')
-        if terms_with_score.empty:
-            logging.error(f"GO list file is empty: {file_path}")
-            return []
-
-        if terms_with_score.shape[1] != 2:
-            logging.error("GO - score file must have exactly two columns (GO Term, Score).")
-            sys.exit(1)
-
+        raw = path.read_text()
     except Exception as e:
         logging.error(f"Failed to load GO - score file: {file_path}\n{e}")
         sys.exit(1)
 
+    if not raw.strip():
+        logging.error(f"GO list file is empty: {file_path}")
+        return ''
+
+    # Optional header line (e.g. 'GO_term\tscore' written by merge_go.py)
+    text = raw.strip()
+    first_line, _, rest = text.partition('\n')
+    if not first_line.startswith('GO:'):
+        text = rest.strip()
+        first_line = text.partition('\n')[0]
+    if not text:
+        logging.error(f"GO list file is empty: {file_path}")
+        return ''
+
+    # Two-column TSV: REVIGO only needs the separator swapped
+    if first_line.count('\t') != 1:
+        logging.error("GO - score file must have exactly two columns (GO Term, Score).")
+        sys.exit(1)
+
     # Return a space-separated string for REVIGO
-    return terms_with_score.to_csv(sep=" ", index=False, header=False)
+    return text.replace('\t', ' ') + '\n'
+
+def build_payload(terms_with_score: str,
+                  cutoff: str = '0.7',
+                  val_type: str = 'Higher',
+                  species: str = '0',
+                  measure: str = 'SIMREL') -> dict:
+    """
+    Builds the form payload for a REVIGO StartJob request.
+    """
+    return {'cutoff': str(cutoff),
+            'valueType': val_type,
+            'measure': measure,
+            'speciesTaxon': species,
+            'goList': terms_with_score
+    }
 
 def submit_revigo(terms_with_score: str,
                   cutoff:str = '0.7',
@@ -67,22 +117,20 @@ def submit_revigo(terms_with_score: str,
     """
     Submits a job to REVIGO with retry logic, returning the job ID upon success.
     """
-    url = f"{BASE_URL}StartJob"
     if not terms_with_score.strip():
         logging.error(f"GO - score file failed to load")
         sys.exit(1)
 
-    payload = {'cutoff': cutoff,
-               'valueType': val_type,
-               'measure': measure,
-               'speciesTaxon': species,
-               'goList': terms_with_score
-    }
+    payload = build_payload(terms_with_score, cutoff, val_type, species, measure)
     for attempt in range(1, max_attempts+1):
         try:
             logging.info(f"Submitting REVIGO job (Attempt {attempt}/{max_attempts})...")
-            r = requests.post(url, headers=HEADERS, data=payload, timeout=30)
+            r = SESSION.post(START_URL, headers=HEADERS, data=payload, timeout=30)
             r.raise_for_status()
+            logging.info(f"REVIGO responded with HTTP {r.status_code}")
+
+            if r.status_code not in (200, 201, 202):
+                logging.warning(f"Unexpected REVIGO status code: {r.status_code}")
 
             job_data = r.json()
             job_id = job_data.get('jobid', -1)
@@ -92,40 +140,44 @@ def submit_revigo(terms_with_score: str,
                 return str(job_id)
             else:
                 msg = job_data.get('message', "unknown error from REVIGO")
-                raise RuntimeError(f"REVIGO error: {msg}")
+                logging.error(f"REVIGO error on attempt {attempt}: {msg}")
 
         except requests.RequestException as e:
             logging.error(f"POST request failed on attempt {attempt}: {e}")
+        except ValueError as e:
+            logging.error(f"Invalid JSON response from REVIGO on attempt {attempt}: {e}")
 
-            if attempt < max_attempts:
-                logging.info(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
-            else:
-                raise RuntimeError("ELM search failed after maximum attempts.")
+        if attempt < max_attempts:
+            wait = min(delay * 2 ** (attempt - 1), MAX_BACKOFF) + random.uniform(0, 2)
+            logging.info(f"Retrying in {wait:.1f} seconds...")
+            time.sleep(wait)
 
-    raise RuntimeError("ELM search failed after all retry attempts.")
+    raise RuntimeError("REVIGO submission failed after all retry attempts.")
 
 def wait_for_completion(job_id: str, output_dir:str, max_wait: int = 60):
     """
     Polls the jstatus endpoint until the job is complete or we hit max_wait seconds.
+    The polling interval grows from POLL_START to POLL_MAX, so quick jobs are detected
+    early and long jobs are polled sparsely. A status request that times out is treated
+    as "still running".
     """
-    url = f"{BASE_URL}QueryJob"
     params = {'jobid': job_id, 'type': 'jstatus'}
 
     logging.info(f"Waiting for REVIGO job {job_id} to complete (timeout={max_wait}s)...")
-    for _ in range(max_wait):
+    interval = POLL_START
+    deadline = time.monotonic() + max_wait
+    while time.monotonic() < deadline:
         try:
-            r = requests.get(url, params=params, timeout=10)
+            # Never let a single request overrun the overall deadline
+            timeout = max(1, min(30, deadline - time.monotonic()))
+            r = SESSION.get(QUERY_URL, params=params, timeout=timeout)
             r.raise_for_status()
             status = r.json()
 
             if status.get('running') == 0:
                 logging.info(f"Job completed with status: {status}")
-                results_link = f"{BASE_URL}/Results?jobid={job_id}"
-                out_path = Path(output_dir) / "revigo_link.txt"
-                out_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(out_path, 'w') as f:
-                    f.write(results_link)
+                results_link = f"{RESULTS_URL}?jobid={job_id}"
+                write_link(results_link, output_dir)
                 print("----------------------------------------------------------")
                 print(f"RESULTS: {results_link}\n       !!!available for 15 minutes!!!")
                 print("----------------------------------------------------------")
@@ -134,54 +186,219 @@ def wait_for_completion(job_id: str, output_dir:str, max_wait: int = 60):
             #else:
                 #msg = status.get('message', "No progress message.")
                 #logging.info(f"Progress: {msg}")
+        except requests.Timeout:
+            logging.info(f"REVIGO job {job_id} still running...")
         except requests.RequestException as e:
             logging.error(f"Failed to query REVIGO job status: {e}")
 
-        time.sleep(1)
+        time.sleep(min(interval, max(0, deadline - time.monotonic())))
+        interval = min(interval * POLL_FACTOR, POLL_MAX)
 
     raise TimeoutError(f"REVIGO job {job_id} did not complete within {max_wait} seconds.")
 
+def write_link(text: str, output_dir: str):
+    """
+    Writes the REVIGO results link (or a note in its place) to {output_dir}/revigo_link.txt
+    """
+    out_path = Path(output_dir) / "revigo_link.txt"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, 'w') as f:
+        f.write(text)
+
+def write_result(text: str, ns_id: str, out_type: str, output_dir: str):
+    """
+    Writes a single REVIGO result to {output_dir}/ontology/result_type.json
+    """
+    out_path = Path(output_dir) / NAMESPACE.get(ns_id) / f"{out_type}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(out_path, 'w') as f:
+        f.write(text)
+    #logging.info(f"Saved {out_path}")
+
+def fetch_result(job_id: str, ns_id: str, out_type: str, output_dir: str,
+                 max_attempts: int = 3) -> str | None:
+    """
+    Fetches a single REVIGO result (namespace + output type), writes it
+    to {output_dir}/ontology/result_type.json and returns its content.
+    A result that is not ready yet is re-requested after a short pause.
+    Returns '' when REVIGO keeps reporting no data for it and None if the request failed.
+    """
+    ontology = NAMESPACE.get(ns_id)
+    params = {'jobid': job_id,
+              'namespace': ns_id,
+              'type': out_type
+    }
+    for attempt in range(1, max_attempts + 1):
+        try:
+            r = SESSION.get(url=QUERY_URL, params=params, timeout=60)
+            r.raise_for_status()
+            text = r.text  # decode the body once, r.text re-decodes on every access
+
+            # The error message is short, only the head of the body needs checking
+            if JOB_ERROR_MSG not in text[:len(JOB_ERROR_MSG) + 64].lower():
+                write_result(text, ns_id, out_type, output_dir)
+                return text
+
+            if attempt == max_attempts:
+                logging.warning(f"REVIGO returned error for {ontology}/{out_type}: {text.strip()}")
+                return ""
+        except requests.RequestException as e:
+            logging.error(f"Failed to fetch results for {ontology}/{out_type}: {e}")
+            return None
+
+        time.sleep(0.5 * attempt)
+
 def parse_results(job_id: str,
                   namespaces: list[str],
                   result_types: list[str],
-                  output_dir: str):
+                  output_dir: str,
+                  skip: set | None = None,
+                  key: str | None = None) -> dict:
     """
     Fetches the REVIGO results for each requested namespace & output type.
-    Writes each result to {output_dir}/ontology/result_type.json
+    Requests are independent, so they are issued concurrently on the shared session.
+    (namespace, result type) pairs in `skip` are not fetched; when a cache `key`
+    is given, every fetched result is cached as soon as it arrives (pairs REVIGO
+    has no data for are cached as such, but left out of the returned dict).
+    Writes each result to {output_dir}/ontology/result_type.json and returns
       {
         '1': {'jTable': "...", 'jScatterplot': "..."},
         '2': {...},
         ...
       }
     """
-    url = f"{BASE_URL}QueryJob"
+    results = {}
+    skip = skip or set()
+    tasks = [(ns_id, out_type) for ns_id in namespaces for out_type in result_types
+             if (ns_id, out_type) not in skip]
+    if not tasks:
+        return results
+
+    # At most 3 namespaces x 3 result types, one worker per request
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = {executor.submit(fetch_result, job_id, ns_id, out_type, output_dir): (ns_id, out_type)
+                   for ns_id, out_type in tasks}
+        for future in as_completed(futures):
+            ns_id, out_type = futures[future]
+            try:
+                text = future.result()
+            except Exception as e:
+                logging.error(f"Failed to fetch results for {NAMESPACE.get(ns_id)}/{out_type}: {e}")
+                continue
+            if text is None:
+                continue
+            if key:
+                save_cached_result(key, ns_id, out_type, text)
+            if text:
+                results.setdefault(ns_id, {})[out_type] = text
 
-    time.sleep(5)
+    return results
 
-    for ns_id in namespaces:
-        ontology = NAMESPACE.get(ns_id)
-        for out_type in result_types:
-            params = {'jobid': job_id,
-                      'namespace': ns_id,
-                      'type': out_type
-            }
-            try:
-                r = requests.get(url=url, params=params, timeout=60)
-                r.raise_for_status()
+def cache_key(payload: dict) -> str:
+    """
+    Returns a stable hash of a REVIGO job payload (GO list + algorithm parameters).
+    """
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
 
-                if 'The Job has an errors, no data available' in r.text.lower():
-                    logging.warning(f"REVIGO returned error for {ontology}/{out_type}: {r.text.strip()}")
+def load_cached_result(key: str, ns_id: str, out_type: str) -> str | None:
+    """
+    Loads a cached REVIGO result, '' if REVIGO had no data for it, or None on a cache miss.
+    """
+    cache_path = CACHE_DIR / key / f"{ns_id}_{out_type}.json.gz"
+    if (CACHE_DIR / key / f"{ns_id}_{out_type}.nodata").is_file():
+        return ""
+    if not cache_path.is_file():
+        return None
+    try:
+        with gzip.open(cache_path, 'rt') as f:
+            return f.read()
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable REVIGO cache entry {cache_path}: {e}")
+        return None
+
+def save_cached_result(key: str, ns_id: str, out_type: str, text: str):
+    """
+    Stores a single REVIGO result as gzipped JSON under CACHE_DIR/key/.
+    An empty text (REVIGO had no data) is stored as an empty .nodata marker.
+    """
+    cache_path = CACHE_DIR / key / f"{ns_id}_{out_type}.json.gz"
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        if not text:
+            cache_path.with_name(f"{ns_id}_{out_type}.nodata").touch()
+            return
+        with gzip.open(cache_path, 'wt') as f:
+            f.write(text)
+    except Exception as e:
+        logging.warning(f"Failed to cache REVIGO result {NAMESPACE.get(ns_id)}/{out_type}: {e}")
+
+def load_cached_link(key: str) -> str | None:
+    """
+    Loads the results link of the REVIGO job that produced a cached payload, or None.
+    """
+    try:
+        return (CACHE_DIR / key / "revigo_link.txt").read_text()
+    except OSError:
+        return None
+
+def save_cached_link(key: str, results_link: str):
+    try:
+        cache_path = CACHE_DIR / key / "revigo_link.txt"
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(results_link)
+    except OSError as e:
+        logging.warning(f"Failed to cache REVIGO results link: {e}")
+
+def run_revigo(terms_with_score: str,
+               namespaces: list[str],
+               result_types: list[str],
+               output_dir: str,
+               cutoff: str = '0.7',
+               max_attempts: int = 5,
+               max_wait: int = 60,
+               use_cache: bool = True) -> dict:
+    """
+    Runs the whole REVIGO submit -> poll -> fetch sequence.
+    Results are cached on disk per (payload hash, namespace, result type): identical
+    reruns skip REVIGO entirely and interrupted runs only fetch what is missing.
+    """
+    payload = build_payload(terms_with_score, cutoff)
+    key = cache_key(payload)
+    results = {}
+    cached = set() # (namespace, result type) pairs answered from the cache, including "no data" ones
+
+    if use_cache:
+        for ns_id in namespaces:
+            for out_type in result_types:
+                text = load_cached_result(key, ns_id, out_type)
+                if text is None:
                     continue
-                else:
-                    out_path = Path(output_dir) / ontology / f"{out_type}.json"
-                    out_path.parent.mkdir(parents=True, exist_ok=True)
-
-                    with open(out_path, 'w') as f:
-                        f.write(r.text)
-                    #logging.info(f"Saved {out_path}")
-            except requests.RequestException as e:
-                logging.error(f"Failed to fetch results for {ontology}/{out_type}: {e}")
-                continue
+                cached.add((ns_id, out_type))
+                if text:
+                    results.setdefault(ns_id, {})[out_type] = text
+                    write_result(text, ns_id, out_type, output_dir)
+
+    if len(cached) == len(namespaces) * len(result_types):
+        logging.info(f"Using cached REVIGO results ({key[:10]}).")
+        # REVIGO links expire after 15 minutes, the cached one is kept for reference only
+        results_link = load_cached_link(key)
+        write_link(f"{results_link}\n(cached results, the link has most likely expired)" if results_link
+                   else "(cached results, no REVIGO job was run)", output_dir)
+        return results
+    if cached:
+        logging.info(f"Reusing {len(cached)} cached REVIGO results, fetching the rest.")
+
+    job_id = submit_revigo(terms_with_score=terms_with_score, cutoff=cutoff, max_attempts=max_attempts)
+    wait_for_completion(job_id, output_dir=output_dir, max_wait=max_wait)
+    if use_cache:
+        save_cached_link(key, f"{RESULTS_URL}?jobid={job_id}")
+    fetched = parse_results(job_id, namespaces, result_types, output_dir=output_dir,
+                            skip=cached, key=key if use_cache else None)
+
+    for ns_id, by_type in fetched.items():
+        results.setdefault(ns_id, {}).update(by_type)
+    return results
 
 
 def main():
@@ -192,6 +409,7 @@ def main():
     parser.add_argument("--max_attempts", type=int, default=5, help="Max attempts for REVIGO submission (default=5).")
     parser.add_argument("--max_wait", type=int, default=120, help="Max wait time for REVIGO submission (default=120).")
     parser.add_argument("--cutoff", type=float, default=0.7, help="Cutoff for REVIGO algorithm (default=0.7).")
+    parser.add_argument("--no_cache", action="store_true", help="Ignore cached REVIGO results and always query REVIGO.")
 
     args = parser.parse_args()
     timestamp = int(time.time())
@@ -208,14 +426,15 @@ def main():
         # 1) Load the local GO data
         terms_str = load_csv(file_path=args.go_terms)
 
-        # 2) Submit job
-        job_id = submit_revigo(terms_with_score=terms_str)
-
-        # 3) Wait for completion
-        wait_for_completion(job_id, output_dir=args.output_dir, max_wait=args.max_wait)
-
-        # 4) Fetch results
-        parse_results(job_id, ontologies, result_types, output_dir=args.output_dir)
+        # 2) Submit job, wait for completion and fetch results (or reuse cached ones)
+        run_revigo(terms_with_score=terms_str,
+                   namespaces=ontologies,
+                   result_types=result_types,
+                   output_dir=args.output_dir,
+                   cutoff=str(args.cutoff),
+                   max_attempts=args.max_attempts,
+                   max_wait=args.max_wait,
+                   use_cache=not args.no_cache)
 
         elapsed = int(time.time() - timestamp)
         logging.info(f"Elapsed time: {format_time(elapsed)}")
@@ -1,11 +1,13 @@
 import argparse
+import mmap
+import os
 import sys
-import pyfastaq
 from pathlib import Path
 
 # Valid amino acid characters
 AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"  # Standard single-letter amino acid codes
 MAX_SEQ_LEN = 400 # max allowed length for FoldSeek
+STRIP_AMINO_ACIDS = str.maketrans("", "", AMINO_ACIDS) # translate table deleting valid residues
 
 def is_valid_seq(seq: str, max_len: int=400) -> bool:
     """
@@ -19,7 +21,36 @@ def is_valid_seq(seq: str, max_len: int=400) -> bool:
     Returns:
         bool: True if valid, False otherwise.
     """
-    return 0 < len(seq) <= max_len and all(char in AMINO_ACIDS for char in seq.upper())
+    # Anything left after deleting the valid residues is an invalid character
+    return 0 < len(seq) <= max_len and not seq.upper().translate(STRIP_AMINO_ACIDS)
+
+def iter_fasta_seqs(file_path: Path):
+    """
+    Yield the sequences of a FASTA file one record at a time.
+    The file is memory-mapped and records are located with bytes.find, so only the
+    records actually consumed are copied out of the file.
+
+    Args:
+        file_path (path): Path to the FASTA file.
+
+    Yields:
+        str: Sequence of the next record with line breaks and whitespace removed.
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header = mm.find(b">")
+            while header != -1:
+                start = mm.find(b"\n", header)
+                if start == -1:
+                    return
+                end = mm.find(b"\n>", start)
+                next_header = end + 1 if end != -1 else -1
+                if end == -1:
+                    end = len(mm)
+                yield mm[start + 1:end].translate(None, b"\n\r \t").decode("ascii", "replace")
+                header = next_header
 
 def parse_fasta(file_path: Path, max_len: int) -> str:
     """
@@ -37,9 +68,9 @@ def parse_fasta(file_path: Path, max_len: int) -> str:
     """
     valid_seq = None
 
-    for record in pyfastaq.sequences.file_reader(str(file_path)):
-        if is_valid_seq(record.seq, max_len):
-            valid_seq = record.seq
+    for seq in iter_fasta_seqs(file_path):
+        if is_valid_seq(seq, max_len):
+            valid_seq = seq
             break
 
     if not valid_seq:
@@ -87,8 +118,8 @@ if __name__ == "__main__":
     except ValueError as err:
         print(f"Error reading fasta file: {err}", file=sys.stderr)
         sys.exit(1)
-    except pyfastaq.sequences.Error as err:
-        print(f"[ERROR] Invalid FASTA format: {err}", file=sys.stderr)
+    except OSError as err:
+        print(f"[ERROR] Could not read FASTA file: {err}", file=sys.stderr)
         sys.exit(1)
     except Exception as err:
         print(f"[ERROR] Unexpected error: {err}", file=sys.stderr)
@@ -1,26 +1,38 @@
 #!/usr/bin/env python
 
-import numpy as np
-import pandas as pd
 import edlib
 import logging
 import argparse
 import sys
 import time
 import re
-import os
-from Bio.Blast import NCBIWWW, NCBIXML
+import heapq
+import hashlib
+import json
+import functools
+import inspect
+import random
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import namedtuple, Counter
+import xml.etree.ElementTree as ET
+from Bio.Blast import NCBIWWW
 from Bio import Entrez
-from scipy.cluster.hierarchy import linkage, fcluster
-from scipy.spatial.distance import squareform
 from check_input import get_seq
 from pathlib import Path
 
 # --------------------------------------------------
 # Configuration
 # --------------------------------------------------
-DBS = ['swissprot', 'refseq_protein', 'nr', 'genbank', 'gnomon', 'pdb']
+DBS = ('swissprot', 'refseq_protein', 'nr', 'genbank', 'gnomon', 'pdb') # ordered for help/error messages
+DB_SET = frozenset(DBS)
 PROGS = ['blastp', 'tblastn']
+CIGAR_RE = re.compile(r"(\d+)([=XID])")
+MAX_CONCURRENT_BLAST = 3 # NCBI asks for no more than 3 concurrent requests
+RETRY_CODES = (429, 503)
+BLAST_CACHE_DIR = Path(__file__).resolve().parent.parent / ".blast_cache"
+BLAST_CACHE_MAX_AGE = 30 * 24 * 3600 # databases are updated, re-run BLAST after 30 days
+CACHE_IGNORED_ARGS = {"num_threads"} # arguments that don't change the results
 
 logging.basicConfig(
     level=logging.INFO,
@@ -34,24 +46,55 @@ def format_time(seconds):
     mins, sec = divmod(seconds, 60)
     return f"{mins}m:{sec:02d}s"
 
-# 1. Function to validate a hit
-def validate_hit(rank=None, k_max=None, eval=None, max_eval=None, identity=None, min_ident=None):
+def blast_cache_key(name: str, arguments: dict) -> str:
     """
-    Validate a BLAST hit based on rank, e-value, and identity thresholds.
-    Args:
-        rank (int): Rank of the hit.
-        k_max (int): Maximum allowable rank.
-        eval (float): E-value of the hit.
-        max_eval (float): Maximum allowable e-value.
-        identity (float): Sequence identity.
-        min_identity (float): Minimum allowable identity.
+    Hash the pipeline name and its arguments. A FASTA path is replaced by a hash of its content.
+    """
+    arguments = {name: value for name, value in arguments.items() if name not in CACHE_IGNORED_ARGS}
+    if "fasta_file" in arguments:
+        arguments["fasta_file"] = hashlib.sha256(Path(arguments["fasta_file"]).read_bytes()).hexdigest()
+    key_src = json.dumps({"pipeline": name, **arguments}, sort_keys=True, default=str)
+    return hashlib.sha256(key_src.encode()).hexdigest()
 
-    Returns:
-        bool: True if hit is valid, False otherwise.
+def cached_blast(run_blast):
+    """
+    Cache the representative IDs returned by a BLAST pipeline on disk, keyed by its arguments.
+    A repeated query with the same sequence, database and parameters skips BLAST entirely.
+    Pass use_cache=False to force a new search.
     """
-    return not ((rank is not None and k_max is not None and rank >= k_max) or
-                (eval is not None and max_eval is not None and eval > max_eval) or
-                (identity is not None and min_ident is not None and identity < min_ident))
+    signature = inspect.signature(run_blast)
+
+    @functools.wraps(run_blast)
+    def wrapper(*args, use_cache=True, **kwargs):
+        if not use_cache:
+            return run_blast(*args, **kwargs)
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        try:
+            cache_path = BLAST_CACHE_DIR / f"{blast_cache_key(run_blast.__name__, bound.arguments)}.json"
+        except OSError as e:
+            logging.warning(f"BLAST cache disabled for this query: {e}")
+            return run_blast(*args, **kwargs)
+
+        try:
+            if time.time() - cache_path.stat().st_mtime <= BLAST_CACHE_MAX_AGE:
+                rep_ids = json.loads(cache_path.read_text())["rep_ids"]
+                logging.info(f"Using cached BLAST results ({len(rep_ids)} representatives).")
+                return rep_ids
+        except (OSError, ValueError, KeyError):
+            pass
+
+        rep_ids = run_blast(*args, **kwargs)
+        if rep_ids: # Empty results may come from a failed run, don't keep them
+            try:
+                BLAST_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                cache_path.write_text(json.dumps({"rep_ids": rep_ids, "cached_at": int(time.time())}))
+            except OSError as e:
+                logging.warning(f"Failed to cache BLAST results: {e}")
+        return rep_ids
+
+    return wrapper
 
 def seq_identity(seq1: str, seq2:str)->float:
     """
@@ -70,93 +113,151 @@ def seq_identity(seq1: str, seq2:str)->float:
     short, long = (seq1, seq2) if len(seq1) <= len(seq2) else (seq2, seq1)
 
     try:
+        # Extended CIGAR ('=' match, 'X' mismatch, 'I'/'D' gaps) gives the match count directly
         aligned = edlib.align(short, long, task="path")
-        matches = sum(1 for char in edlib.getNiceAlignment(aligned, short, long)["matched_aligned"] if char == "|")
+        matches = sum(int(n) for n, op in CIGAR_RE.findall(aligned["cigar"]) if op == "=")
         return matches / len(short)
     except Exception as e:
         logging.error(f"Error in alignment: {e}")
         return 0
 
-# 3. Function to extract BLAST hits into a DataFrame
-def extract_hits(xml_res)->pd.DataFrame:
+def max_identity(counts1: Counter, counts2: Counter, short_len: int) -> float:
     """
-    Parse BLAST XML results into a DataFrame.
+    Upper bound of seq_identity from residue composition alone.
+    An alignment can't match more residues of a kind than the sequence with fewer of them has.
+    Args:
+        counts1 (Counter): Residue counts of the first sequence.
+        counts2 (Counter): Residue counts of the second sequence.
+        short_len (int): Length of the shorter sequence.
+
+    Returns:
+        float: Highest identity the two sequences could reach.
+    """
+    if not short_len:
+        return 0
+    return sum((counts1 & counts2).values()) / short_len
+
+# 1. Function to extract the best BLAST hits
+# A few hundred rows at most, plain tuples avoid the per-operation pandas overhead
+Hit = namedtuple("Hit", ["id", "seq", "length", "evalue", "identity"])
+
+def extract_hits(xml_res, k_max=None, max_eval=None, min_ident=None)->list[Hit]:
+    """
+    Parse BLAST XML results into a list of the best hits.
+    The XML is streamed hit by hit, each <Hit> element is released once read.
+    Filtering happens in the same pass: HSPs above max_eval are skipped, a bounded
+    heap keeps the k_max lowest e-values and those are then checked against min_ident.
     Args:
         xml_res: XML result handle from BLAST.
+        k_max (int): Maximum allowable rank.
+        max_eval (float): Maximum allowable e-value.
+        min_ident (float): Minimum allowable identity.
 
     Returns:
-        pd.DataFrame: DataFrame with hit details.
+        list[Hit]: Hit details sorted by e-value.
     """
+    heap = [] # (-evalue, -order, hit), the root is the worst hit kept so far
+    order = 0
     try:
-        blast_records = NCBIXML.parse(xml_res)
-    except Exception as e:
+        for _, elem in ET.iterparse(xml_res, events=("end",)):
+            if elem.tag != "Hit":
+                continue
+            accession = elem.findtext("Hit_accession")
+            for hsp in elem.iterfind("Hit_hsps/Hsp"):
+                evalue = float(hsp.findtext("Hsp_evalue"))
+                if max_eval is not None and evalue > max_eval:
+                    continue
+                sbjct = hsp.findtext("Hsp_hseq", "")
+                identity = int(hsp.findtext("Hsp_identity")) / int(hsp.findtext("Hsp_align-len")) * 100
+                item = (-evalue, -order, Hit(accession, sbjct, len(sbjct), evalue, identity))
+                order += 1
+                if k_max is None or len(heap) < k_max:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heappushpop(heap, item)
+            elem.clear()
+    except (ET.ParseError, TypeError, ValueError) as e:
         logging.error(f"Failed to parse BLAST XML: {e}")
-        return pd.DataFrame()  # Return empty DataFrame to handle gracefully
-
-    hits = []
-    for record in blast_records:
-        for aln in record.alignments:
-            for hsp in aln.hsps:
-                hits.append({
-                    "id": aln.accession,
-                    "seq": hsp.sbjct,
-                    "len": len(hsp.sbjct),
-                    "evalue": hsp.expect,
-                    "identity": hsp.identities / hsp.align_length * 100
-                })
-    return pd.DataFrame(hits)
-
-# 4. Function to cluster sequences and select representatives
-def cluster_sequences(df, threshold=0.9)->pd.DataFrame:
+        return []  # Return no hits to handle gracefully
+
+    # Rank is taken among all hits within max_eval, identity is checked afterwards
+    hits = [hit for _, _, hit in sorted(heap, reverse=True)]
+    if min_ident is not None:
+        hits = [hit for hit in hits if hit.identity >= min_ident]
+    return hits
+
+# 2. Function to cluster sequences and select representatives
+def cluster_sequences(hits, threshold=0.9)->list[Hit]:
     """
-    Cluster sequences and pick representatives.
+    Cluster sequences greedily and pick representatives.
+    Hits are taken best first, a hit at least threshold similar to an existing
+    representative is dropped, otherwise it becomes a new representative.
     Args:
-        df (pd.DataFrame): DataFrame with sequences.
+        hits (list[Hit]): Hits with sequences.
         threshold (float): Similarity threshold for clustering.
 
     Returns:
-        pd.DataFrame: DataFrame with representative sequences.
-    """
-    """
-    Clusters sequences based on similarity and selects representatives.
+        list[Hit]: Representative hits.
     """
-    seqs = df["seq"].tolist()
-    n = len(seqs)
+    n = len(hits)
 
     # === Step 1: Edge Case Handling ===
     if n == 0:
         logging.warning("No sequences provided for clustering.")
-        return pd.DataFrame()  # Return empty DataFrame
+        return []
     if n == 1:
         logging.info("Only one sequence present. No clustering necessary.")
-        return df.copy()
-
-    # === Step 2: Compute Pairwise Identity Matrix ===
-    identity_matrix = np.zeros((n, n))
-    for i in range(n):
-        for j in range(i + 1, n):  # Only upper triangle
-            identity_matrix[i, j] = seq_identity(seqs[i], seqs[j])
-            identity_matrix[j, i] = identity_matrix[i, j]  # Mirror to lower triangle
-
-    # === Step 3: Convert to Condensed Distance Matrix ===
-    dst_matrix = 1 - identity_matrix  # Convert similarity to distance
-    condensed = squareform(dst_matrix, checks=False)
-    link_matrix = linkage(condensed, method="average")
-    clusters = fcluster(link_matrix, t=1 - threshold, criterion="distance")
-
-    # Select representative hits
-    reps = []
-    for cluster in np.unique(clusters):
-        indices = np.where(clusters == cluster)[0]
-        cluster_df = df.iloc[indices]
-        top_hit = cluster_df.sort_values(by=["identity", "evalue", "len"], ascending=[False, True, True]).iloc[0]
-        reps.append(top_hit)
+        return list(hits)
 
-    return pd.DataFrame(reps)
+    # === Step 2: Greedy clustering (CD-HIT style) ===
+    # Best hits become cluster representatives first, every other hit is only
+    # aligned against the current representatives instead of against all hits.
+    ranked = sorted(hits, key=lambda hit: (-hit.identity, hit.evalue, hit.length))
+    # Pairs whose composition can't reach the threshold are rejected without aligning them.
+    reps = []
+    rep_counts = []
+    seen = set()
+    for hit in ranked:
+        # Identical sequences (e.g. the same isoform hit in several entries) collapse onto the best hit before any alignment
+        if hit.seq in seen:
+            continue
+        seen.add(hit.seq)
+        counts = Counter(hit.seq)
+        if all(max_identity(counts, rep_count, min(hit.length, rep.length)) < threshold
+               or seq_identity(hit.seq, rep.seq) < threshold
+               for rep, rep_count in zip(reps, rep_counts)):
+            reps.append(hit)
+            rep_counts.append(counts)
+
+    return reps
 
 # --------------------------------------------------
 # API BLAST pipeline
 # --------------------------------------------------
+def qblast_with_retry(prog, db, query_seq, max_attempts=3, delay=30):
+    """
+    Submit a remote BLAST query, backing off when NCBI is rate limiting (429/503).
+    Args:
+        prog (str): BLAST program.
+        db (str): BLAST database.
+        query_seq (str): Query sequence.
+        max_attempts (int): Maximum submission attempts.
+        delay (int): Base delay in seconds, doubled after every attempt.
+
+    Returns:
+        XML result handle from BLAST.
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return NCBIWWW.qblast(prog, db, query_seq)
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_CODES or attempt == max_attempts:
+                raise
+            wait = delay * 2 ** (attempt - 1) + random.uniform(0, delay)
+            logging.warning(f"NCBI returned {e.code} for DB '{db}'. Retrying in {wait:.0f} seconds...")
+            time.sleep(wait)
+
+@cached_blast
 def run_blast_api(query_seq, k_max=10, max_eval=1e-5, min_ident=30.0, cluster_thresh=0.9, db="swissprot", prog="blastp"):
     """
     Execute BLAST and process results.
@@ -173,34 +274,18 @@ def run_blast_api(query_seq, k_max=10, max_eval=1e-5, min_ident=30.0, cluster_th
         list: Representative hit IDs.
     """
     logging.info(f"Running BLAST on database: {db}...")
-    handle = NCBIWWW.qblast(prog, db, query_seq)
-    hits_df = extract_hits(handle)
-
-    if hits_df.empty:
-        logging.warning("No hits found in BLAST search.")
-        return []
+    handle = qblast_with_retry(prog, db, query_seq)
+    hits = extract_hits(handle, k_max=k_max, max_eval=max_eval, min_ident=min_ident)
 
-    hits_df = hits_df.sort_values("evalue", ascending=True).reset_index(drop=True)
-    hits_df = hits_df[hits_df.apply(
-        lambda x: validate_hit(
-            rank=x.name + 1,
-            k_max=k_max,
-            eval=x.evalue,
-            max_eval=max_eval,
-            identity=x.identity,
-            min_ident=min_ident),
-        axis=1
-        )]
-
-    if hits_df.empty:
+    if not hits:
         logging.warning("No hits passed the filtering criteria.")
         return []
 
-    logging.info(f"{len(hits_df)} hits passed filtering. Proceeding to clustering.")
-    clustered_df = cluster_sequences(hits_df, threshold=cluster_thresh)
+    logging.info(f"{len(hits)} hits passed filtering. Proceeding to clustering.")
+    reps = cluster_sequences(hits, threshold=cluster_thresh)
 
-    logging.info(f"Clustering reduced the hits to {len(clustered_df)} unique representatives.")
-    return clustered_df["id"].tolist()
+    logging.info(f"Clustering reduced the hits to {len(reps)} unique representatives.")
+    return [rep.id for rep in reps]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run BLAST to get a list of similar genes.")
@@ -215,6 +300,7 @@ if __name__ == "__main__":
     parser.add_argument("--max_len", type=int, default=400, help="Maximum sequence length (default: 400).")
     parser.add_argument("--email", required=False, help="User email address (required for BLAST). If not provided, you will be prompted.")
     parser.add_argument("--output_file", required=True, help="Path to file where results will be saved" )
+    parser.add_argument("--no_cache", action="store_true", help="Ignore cached BLAST results and always run BLAST.")
     args = parser.parse_args()
 
     try:
@@ -245,7 +331,7 @@ if __name__ == "__main__":
         logging.info("Using default program 'blastp'.")
         args.prog = "blastp"
 
-    valid_dbs = [db for db in args.dbs if db in DBS]
+    valid_dbs = [db for db in dict.fromkeys(args.dbs) if db in DB_SET] # drop repeats, keep order
 
     if not valid_dbs:
         logging.error(f"Invalid databases. Available options are: {', '.join(DBS)}.")
@@ -253,32 +339,35 @@ if __name__ == "__main__":
         valid_dbs = ["swissprot"]
 
     timestamp = int(time.time())
-    all_results = []
-    for db in valid_dbs:
-        try:
-            results = run_blast_api(
-                query_seq=sequence,
-                k_max=args.kMax,
-                max_eval=args.max_eval,
-                min_ident=args.min_ident,
-                cluster_thresh=args.cluster,
-                db=db,
-                prog=args.prog
-            )
-            #if results: print(results)
-            all_results.extend(results)
-        except Exception as e:
-            logging.error(f"Error during BLAST pipeline on DB '{db}': {e}")
+    all_results = set()
+    # Remote BLAST is I/O bound (mostly polling NCBI), so databases are queried concurrently
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_BLAST, len(valid_dbs))) as executor:
+        futures = {executor.submit(
+                        run_blast_api,
+                        query_seq=sequence,
+                        k_max=args.kMax,
+                        max_eval=args.max_eval,
+                        min_ident=args.min_ident,
+                        cluster_thresh=args.cluster,
+                        db=db,
+                        prog=args.prog,
+                        use_cache=not args.no_cache
+                    ): db for db in valid_dbs}
+        for future in as_completed(futures):
+            db = futures[future]
+            try:
+                results = future.result()
+                #if results: print(results)
+                all_results.update(results)
+            except Exception as e:
+                logging.error(f"Error during BLAST pipeline on DB '{db}': {e}")
 
     elapsed = int(time.time()) - timestamp
     logging.info(f"Elapsed: {format_time(elapsed)}")
 
-    all_results = list(set(all_results))
-
     try:
         with open(args.output_file, 'w') as outf:
-            for result in all_results:
-                outf.write(result.strip() + '\n')
+            outf.writelines(result.strip() + '\n' for result in sorted(all_results))
         #logging.info(f"Blast API results saved => {args.output_file}")
 
     except IOError as e:
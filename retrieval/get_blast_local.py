@@ -1,4 +1,4 @@
-import tempfile
+import io
 import logging
 import argparse
 import time
@@ -6,7 +6,8 @@ import os
 import subprocess
 import shlex
 import sys
-from get_blast_api import format_time, validate_hit, extract_hits, cluster_sequences
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from get_blast_api import format_time, extract_hits, cluster_sequences, cached_blast
 # --------------------------------------------------
 # Configuration
 # --------------------------------------------------
@@ -51,6 +52,7 @@ def check_local_database(db_path: str) -> bool:
 # --------------------------------------------------
 # Local BLAST pipeline
 # --------------------------------------------------
+@cached_blast
 def run_blast_local(fasta_file: str,
                     db_path: str,
                     k_max: int = 10,
@@ -58,6 +60,7 @@ def run_blast_local(fasta_file: str,
                     min_ident: float = 30.0,
                     cluster_thresh: float = 0.9,
                     prog: str = "blastp",
+                    num_threads: int = None,
                     ) -> list:
     """
     Run a local BLAST search against a downloaded DB, parse hits, apply filters,
@@ -71,75 +74,48 @@ def run_blast_local(fasta_file: str,
         min_identity (float): Minimum percent identity.
         cluster_thresh (float): Clustering threshold (0-1).
         prog (str): BLAST program to run (e.g., 'blastp', 'blastn', etc.).
+        num_threads (int): Threads for the BLAST binary (default: all cores).
     Returns:
         list[str]: List of representative hit IDs after clustering.
     """
-    out_xml = None
     if not check_local_database(db_path):
         return []
     try:
-        # 1) Create a temporary file for BLAST output (XML)
-        with tempfile.NamedTemporaryFile(suffix='.xml', delete=False) as out_fh:
-            out_xml=out_fh.name
-
-        # 2) Run local BLAST command
+        # 1) Run local BLAST command, XML is written to stdout
         logging.info(f"Running local BLAST on DB: {db_path} ...")
         cmd_args = [
             prog,
             '-query', fasta_file,
             '-db',db_path,
             '-evalue', str(max_eval*100), # Filtering later
+            '-num_threads', str(num_threads or os.cpu_count() or 1),
             '-outfmt', '5', # XML
-            '-out',out_xml
         ]
-        result = subprocess.run(cmd_args, capture_output=True, text=True)
+        result = subprocess.run(cmd_args, capture_output=True)
         if result.returncode != 0:
-            logging.warning(f'Blast stderr: {result.stderr}')
-            return []
-
-        # 3) Parse the resulting XML
-        with open(out_xml, 'r') as xml_handle:
-            hits_df = extract_hits(xml_handle)
-        if hits_df.empty:
-            logging.warning("No hits found in local BLAST search.")
-            logging.info("......................")
+            logging.warning(f'Blast stderr: {result.stderr.decode(errors="replace")}')
             return []
 
-        # Running Blast locally might have different order
-        hits_df = hits_df.sort_values("evalue", ascending=True).reset_index(drop=True)
-
-        # 4) Filter hits using your validate_hit function
-        hits_df = hits_df[hits_df.apply(
-        lambda x: validate_hit(
-            rank=x.name + 1,
-            k_max=k_max,
-            eval=x.evalue,
-            max_eval=max_eval,
-            identity=x.identity,
-            min_ident=min_ident),
-        axis=1
-        )]
-        if hits_df.empty:
+        # 2) Parse the resulting XML, sorting by e-value and filtering hits on the fly
+        #    (running Blast locally might have different order)
+        hits = extract_hits(io.BytesIO(result.stdout), k_max=k_max, max_eval=max_eval, min_ident=min_ident)
+        if not hits:
             logging.warning("No hits passed the filtering criteria.")
             logging.info("......................")
             return []
-        logging.info(f"{len(hits_df)} hits passed filtering. Proceeding to clustering.")
+        logging.info(f"{len(hits)} hits passed filtering. Proceeding to clustering.")
 
-        # 5) Cluster hits
-        clustered_df = cluster_sequences(hits_df, threshold=cluster_thresh)
-        logging.info(f"Clustering reduced the hits to {len(clustered_df)} unique representatives.")
+        # 3) Cluster hits
+        reps = cluster_sequences(hits, threshold=cluster_thresh)
+        logging.info(f"Clustering reduced the hits to {len(reps)} unique representatives.")
 
-        return clustered_df['id'].tolist()
+        return [rep.id for rep in reps]
 
     except Exception as e:
 
-        logging.error(f"Error in run_local_blast_tempfile: {e}")
+        logging.error(f"Error in run_blast_local: {e}")
         return []
 
-    finally:
-        if out_xml and os.path.exists(out_xml):
-            os.remove(out_xml)
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run BLAST localy to get a list of similar genes.")
     parser.add_argument("--fasta", required=True, help="Amino acid sequence for BLAST query.")
@@ -150,6 +126,7 @@ if __name__ == "__main__":
     parser.add_argument("--min_ident", type=float, default=40.0, help="Minimum identity percentage (default: 40.0).")
     parser.add_argument("--cluster", type=float, default=0.9, help="Clustering threshold (default: 0.9).")
     parser.add_argument("--output_file", required=True, help="Path to file where results will be saved" )
+    parser.add_argument("--no_cache", action="store_true", help="Ignore cached BLAST results and always run BLAST.")
     args = parser.parse_args()
 
     # Validate the selected program
@@ -160,31 +137,38 @@ if __name__ == "__main__":
 
     timestamp = int(time.time())
 
-    all_results = []
-    for db in args.db_paths:
-        try:
-            results = run_blast_local(
-                fasta_file=args.fasta,
-                db_path=db,
-                k_max=args.kMax,
-                max_eval=args.max_eval,
-                min_ident=args.min_ident,
-                cluster_thresh=args.cluster,
-                prog=args.prog,
-            )
-            #if results: print(results)
-            all_results.extend(results)
-        except Exception as e:
-            logging.error(f"Error during BLAST pipeline on DB '{db}': {e}")
+    all_results = set()
+    # BLAST runs in a subprocess, so threads are enough to search the databases concurrently.
+    # Cores are split between the searches instead of each one claiming all of them.
+    db_paths = list(dict.fromkeys(args.db_paths))
+    threads_per_db = max(1, (os.cpu_count() or 1) // len(db_paths))
+    with ThreadPoolExecutor(max_workers=len(db_paths)) as executor:
+        futures = {executor.submit(
+                        run_blast_local,
+                        fasta_file=args.fasta,
+                        db_path=db,
+                        k_max=args.kMax,
+                        max_eval=args.max_eval,
+                        min_ident=args.min_ident,
+                        cluster_thresh=args.cluster,
+                        prog=args.prog,
+                        num_threads=threads_per_db,
+                        use_cache=not args.no_cache,
+                    ): db for db in db_paths}
+        for future in as_completed(futures):
+            db = futures[future]
+            try:
+                results = future.result()
+                #if results: print(results)
+                all_results.update(results)
+            except Exception as e:
+                logging.error(f"Error during BLAST pipeline on DB '{db}': {e}")
 
     elapsed = int(time.time()) - timestamp
     logging.info(f"Elapsed: {format_time(elapsed)}")
-
-    all_results = list(set(all_results))
     try:
         with open(args.output_file, 'w') as outf:
-            for result in all_results:
-                outf.write(result.strip() + '\n')
+            outf.writelines(result.strip() + '\n' for result in sorted(all_results))
         #logging.info(f"Blast local results saved => {args.output_file}")
     except IOError as e:
         logging.error(f"Error writing results to {args.output_file}: {e}")
@@ -14,13 +14,23 @@ Pipeline:
 from pathlib import Path
 import argparse
 import json
+import pickle
+import functools
+import hashlib
 import time
+import random
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
 import logging
 import os
 import sys
+from collections import defaultdict
 import pandas as pd
+from io import StringIO
 from check_input import get_seq
+from http_utils import retry_after_seconds
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,9 +43,23 @@ def format_time(seconds):
 
 ELM_API_URL = "http://elm.eu.org/start_search/"
 MAX_SEQUENCE_LENGTH = 2000     # ELM GET endpoint limit
+MAX_BACKOFF = 300              # cap for exponential retry delays (s)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SCRIPT_DIR = os.path.dirname(BASE_DIR)
 ELM_GO_FILE = f"{SCRIPT_DIR}/meta/elm_go_terms.tsv"
+ELM_CACHE_DIR = Path(SCRIPT_DIR) / ".elm_cache" # pickled GO mappings, keyed on TSV path + mtime
+
+# Shared session, keep-alive connections are reused across calls (and polling)
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                       max_retries=Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504],
+                                         respect_retry_after_header=True, raise_on_status=False))
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+atexit.register(SESSION.close)
+
+# Monotonic time until which ELM asked us to back off, later submissions wait it out first
+_rate_limited_until = 0.0
 
 # high confidence classes
 ALLOWED_CLASSES = {
@@ -45,58 +69,95 @@ ALLOWED_CLASSES = {
     "TRG"   # Targeting signals
 }
 
+@functools.lru_cache(maxsize=4)
 def load_go_mapping(go_terms_file=ELM_GO_FILE):
     """
     Loads ELM -> GO mappings from a TSV file.
+    The grouped mapping is pickled to ELM_CACHE_DIR under a name derived from the TSV's
+    path, mtime and size, so an edited TSV is never served from a stale pickle.
+    Failures raise instead of returning, so they are not memoised by lru_cache.
 
     Returns:
         dict: { ELM_class: [GO:terms, evidence_score==1] } # ELM GO are not confident
+
+    Raises:
+        FileNotFoundError: If go_terms_file does not exist.
     """
     #logging.info(f"Loading GO terms from: {go_terms_file}")
-    go_path = Path(go_terms_file)
+    go_path = Path(go_terms_file).resolve()
 
-    if go_path.is_file():
-        df = pd.read_csv(go_terms_file, sep='\t')
+    if not go_path.is_file():
+        logging.error(f"Provided go annoation file is invalid. {go_terms_file}")
+        raise FileNotFoundError(go_terms_file)
 
-        go_mapping = df.groupby('ELM')['GOTerm'].apply(list).to_dict()
-        return go_mapping
-
-    else:
-        logging.ERROR(f"Provided go annoation file is invalid. {go_terms_file}")
-        return []
+    stat = go_path.stat()
+    prefix = hashlib.sha1(str(go_path).encode()).hexdigest()[:16]
+    pickle_path = ELM_CACHE_DIR / f"{prefix}_{stat.st_mtime_ns}_{stat.st_size}.pkl"
+    try:
+        with open(pickle_path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    df = pd.read_csv(go_path, sep='\t', usecols=['ELM', 'GOTerm'])
+
+    # One pass over the two columns, no per-group Series
+    grouped = defaultdict(list)
+    for elm, go_term in zip(df['ELM'].tolist(), df['GOTerm'].tolist()):
+        grouped[elm].append(go_term)
+    go_mapping = dict(grouped)
+    try:
+        ELM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for old in ELM_CACHE_DIR.glob(f"{prefix}_*.pkl"): # pickles of earlier versions of this TSV
+            old.unlink()
+        with open(pickle_path, 'wb') as f:
+            pickle.dump(go_mapping, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        logging.debug(f"Could not cache ELM GO mapping: {e}")
+    return go_mapping
 
 
 def submit_elm(sequence, max_attempts=5, delay=60):
     """
     Submits a protein sequence to ELM motif search.
-    Retries on 429 errors or connection failures.
+    Retries on 429 errors or connection failures, waiting for Retry-After when ELM
+    sends it and for a jittered exponential backoff otherwise.
     """
+    global _rate_limited_until
     url = f"{ELM_API_URL}{sequence}"
     headers = {"Accept": "text/tab-separated-values"}
 
     for attempt in range(1, max_attempts+1):
+        backoff = min(MAX_BACKOFF, delay * 2 ** (attempt - 1)) + random.uniform(0, delay)
         try:
-            logging.info(f"Submitting ELM search (Attempt {attempt}/{max_attempts})...")
-            response = requests.get(url, headers=headers)
+            throttle = _rate_limited_until - time.monotonic()
+            if throttle > 0:
+                logging.info("Still inside the ELM rate-limit window, waiting %.0f seconds...", throttle)
+                time.sleep(throttle)
+
+            logging.info("Submitting ELM search (Attempt %d/%d)...", attempt, max_attempts)
+            response = SESSION.get(url, headers=headers)
 
             if response.status_code == 200:
                 logging.info("ELM search completed successfully.")
                 return response.text
 
             elif response.status_code == 429:
-                logging.warning("Rate limit hit (429 Too Many Requests). Waiting 60 seconds before retrying...")
-                time.sleep(delay)
+                retry_after = retry_after_seconds(response)
+                wait = retry_after if retry_after is not None else backoff
+                _rate_limited_until = time.monotonic() + wait
+                logging.warning("Rate limit hit (429 Too Many Requests). Waiting %.0f seconds before retrying...", wait)
 
             else:
-                logging.error(f"Unexpected response: {response.status_code}")
+                logging.error("Unexpected response: %s", response.status_code)
                 response.raise_for_status()
 
         except requests.RequestException as e:
-            logging.error(f"Connection error on attempt {attempt}: {e}")
+            logging.error("Connection error on attempt %d: %s", attempt, e)
 
             if attempt < max_attempts:
-                logging.info(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
+                logging.info("Retrying in %.0f seconds...", backoff)
+                time.sleep(backoff)
             else:
                 raise RuntimeError("ELM search failed after maximum attempts.")
 
@@ -105,35 +166,17 @@ def submit_elm(sequence, max_attempts=5, delay=60):
 def parse_elm_tsv(tsv_text):
     """
     Parses the TSV output from ELM and filters motif hits.
+    Only the identifier and is_filtered columns are read, the filtering is vectorised.
     """
-    lines = tsv_text.strip().split('\n')
-
-    motifs = set()
-    for line in lines[1:]:
-        if not line.strip():
-            continue
-        cols = line.split('\t')
-
-        motif = {
-            "elm_identifier": cols[0],
-            "start": int(cols[1]),
-            "stop": int(cols[2]),
-            "is_annotated": cols[3].lower() == "true",
-            "is_phiblastmatch": cols[4].lower() == "true",
-            "is_filtered": cols[5].lower() == "true",
-            "structure": cols[6].lower() == "true",
-            "topodomfilter": cols[7].lower() == "true",
-            "taxonfilter": cols[8].lower() == "true"
-        }
-
-        if motif["is_filtered"]:
-            continue  # Skip motifs filtered by ELM
-        elm_id = motif["elm_identifier"]
-
-        if elm_id.split('_')[0] in ALLOWED_CLASSES:
-            motifs.add(elm_id)
-
-    return motifs
+    if not tsv_text.strip():
+        return set()
+
+    df = pd.read_csv(StringIO(tsv_text), sep='\t', usecols=[0, 5], dtype=str)
+    elm_ids = df.iloc[:, 0]
+    is_filtered = df.iloc[:, 1].str.lower() == "true"  # Skip motifs filtered by ELM
+    is_allowed = elm_ids.str.split('_', n=1).str[0].isin(ALLOWED_CLASSES)
+
+    return set(elm_ids[~is_filtered & is_allowed])
 
 def get_elm_to_go(motifs: set, go_mapping: dict):
 
@@ -155,18 +198,17 @@ def get_elm_to_go(motifs: set, go_mapping: dict):
 
 def save_go_mapping(elm_to_go, output_json, output_csv):
     try:
+        # json.dumps without indent runs the C encoder (json.dump never does), the file is only read back by merge_go.py
         with open(output_json, "w") as f:
-            json.dump(elm_to_go, f, indent=4)
+            f.write(json.dumps(elm_to_go, separators=(",", ":")))
 
-    except Exception as E:
+    except Exception as e:
         logging.error(f"Failed to save GO terms to json: {e}")
         sys.exit(1)
 
     try:
         with open(output_csv, "w") as f:
-            for _, value in elm_to_go.items():
-                for val in value:
-                    f.write(f"{val[0]}\t{val[1]}\n")
+            f.writelines(f"{go_id}\t{score}\n" for terms in elm_to_go.values() for go_id, score in terms)
     except Exception as e:
         logging.error(f"Failed to save GO terms to csv: {e}")
         sys.exit(1)
@@ -14,13 +14,20 @@ It accepts a FASTA sequence string (already validated elsewhere) and:
 import re
 import argparse
 import time
+import random
 import tarfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
+import numpy as np
 import pandas as pd
 import logging
 import sys
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from check_input import get_seq
+from http_utils import retry_after_seconds
 
 
 """
@@ -35,7 +42,27 @@ For afdb-swissprot:
 Direct use of the UniProt IDs is safe.
 """
 
-DBS = ['afdb50', 'afdb-swissprot', 'afdb-proteome']
+DBS = ('afdb50', 'afdb-swissprot', 'afdb-proteome') # ordered for help/error messages
+DB_SET = frozenset(DBS)
+AF_ID_RE = re.compile(r"AF-([A-Z0-9]+)-") # UniProt accession inside AlphaFold DB target names
+RESULT_COLUMNS = [1, 2, 10] # target, identity, e-value in FoldSeek's m8 output
+POLL_FACTOR = 1.5    # polling interval growth per unfinished check
+POLL_MAX = 30        # polling interval cap (s)
+RATELIMIT_DELAY = 10 # base wait (s) after a RATELIMIT status, doubled while it persists
+MAX_BACKOFF = 300
+
+# Shared session, keep-alive connections are reused across calls (and polling)
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                       max_retries=Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504],
+                                         respect_retry_after_header=True, raise_on_status=False))
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+atexit.register(SESSION.close)
+
+# Monotonic time until which FoldSeek asked us to back off, shared by every poll in the process
+_rate_limited_until = 0.0
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -58,7 +85,7 @@ def get_esmfold_pdb(sequence_str: str) -> bytes:
     url = "https://api.esmatlas.com/foldSequence/v1/pdb/"
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
     logging.info("Converting sequence to PDB using ESMFold...")
-    resp = requests.post(url, headers=headers, data=sequence_str, verify=True)
+    resp = SESSION.post(url, headers=headers, data=sequence_str, verify=True)
     resp.raise_for_status()
     return resp.content
 
@@ -79,16 +106,18 @@ def submit_ticket(file_data: bytes, file_name: str, db: str = "afdb50") -> dict:
 
     url = "https://search.foldseek.com/api/ticket"
     logging.info("Submitting job to FoldSeek...")
-    resp = requests.post(url, files=payload)
+    resp = SESSION.post(url, files=payload)
     resp.raise_for_status()
     return resp.json()
 
-def poll_job(job_id: str, interval: int = 5, max_attempts: int = 100) -> dict:
+def poll_job(job_id: str, interval: float = 1, max_attempts: int = 100) -> dict:
     """
     Poll FoldSeek job status until completion.
+    Short jobs are picked up quickly, the interval then grows by POLL_FACTOR up to POLL_MAX
+    (or follows the server's estimated_time when it reports one).
     Args:
         job_id (str): Job ID.
-        interval (int): Polling interval in seconds.
+        interval (float): Initial polling interval in seconds.
         max_attempts (int): Maximum polling attempts.
 
     Returns:
@@ -97,9 +126,14 @@ def poll_job(job_id: str, interval: int = 5, max_attempts: int = 100) -> dict:
     Raises:
         TimeoutError: If the job does not complete within the max attempts.
     """
+    global _rate_limited_until
     url = f"https://search.foldseek.com/api/ticket/{job_id}"
+    rate_limits = 0
     for attempt in range(1, max_attempts+1):
-        resp = requests.get(url)
+        throttle = _rate_limited_until - time.monotonic()
+        if throttle > 0:
+            time.sleep(throttle)
+        resp = SESSION.get(url)
         resp.raise_for_status()
         data = resp.json()
         status = data.get("status", "")
@@ -108,52 +142,72 @@ def poll_job(job_id: str, interval: int = 5, max_attempts: int = 100) -> dict:
             logging.info("FoldSeek job completed.")
             return data
         elif status == "ERROR":
-            logging.error(f"FoldSeek job failed: {data}")
+            logging.error("FoldSeek job failed: %s", data)
             raise RuntimeError(f"Job error: {data}")
         elif status == "RATELIMIT":
-            logging.warning("Rate limit encountered. Waiting 10 seconds...")
-            time.sleep(10)
+            rate_limits += 1
+            wait = retry_after_seconds(resp)
+            if wait is None:
+                wait = (min(MAX_BACKOFF, RATELIMIT_DELAY * 2 ** (rate_limits - 1))
+                        + random.uniform(0, RATELIMIT_DELAY))
+            _rate_limited_until = time.monotonic() + wait
+            logging.warning("Rate limit encountered. Waiting %.0f seconds...", wait)
         else:
-            logging.info(f"Attempt {attempt}: status={status}. Retrying in {interval} seconds...")
-            time.sleep(interval)
+            estimated = data.get("estimated_time")
+            wait = min(float(estimated), POLL_MAX) if isinstance(estimated, (int, float)) and estimated > 0 else interval
+            logging.info("Attempt %d: status=%s. Retrying in %.1f seconds...", attempt, status, wait)
+            time.sleep(wait)
+            interval = min(interval * POLL_FACTOR, POLL_MAX)
     raise TimeoutError("Job did not complete within the maximum attempts.")
 
-def download_results(job_id: str) -> bytes:
+def download_results(job_id: str) -> requests.Response:
     """
-    Download results from a FoldSeek job.
+    Start downloading results from a FoldSeek job.
+    The body is not read here, the caller streams it from resp.raw and closes the response.
     Args:
         job_id (str): Job ID.
     Returns:
-        bytes: Compressed results file.
+        requests.Response: Streaming response with the compressed results file.
     """
     url = f"https://search.foldseek.com/api/result/download/{job_id}"
     logging.info("Downloading FoldSeek results...")
-    resp = requests.get(url, stream=True)
-    resp.raise_for_status()
-    return resp.content
+    resp = SESSION.get(url, stream=True)
+    try:
+        resp.raise_for_status()
+    except requests.HTTPError:
+        resp.close()
+        raise
+    resp.raw.decode_content = True # undo any HTTP-level Content-Encoding
+    return resp
 
-def parse_results(tar_bytes: bytes) -> pd.DataFrame:
+def parse_results(tar_stream) -> pd.DataFrame:
     """
     Extract FoldSeek results into a DataFrame.
+    The tar.gz is decompressed as it streams in, members are concatenated and parsed once,
+    keeping only the columns used for filtering (1: target, 2: identity, 10: e-value).
     Args:
-        tar_bytes (bytes): Compressed results file.
+        tar_stream: File object with the compressed results file.
 
     Returns:
         pd.DataFrame: Parsed results as a DataFrame.
     """
-    frames = []
-    with tarfile.open(fileobj=BytesIO(tar_bytes), mode='r:gz') as tar:
+    buf = BytesIO()
+    with tarfile.open(fileobj=tar_stream, mode='r|gz') as tar:
         for member in tar:
             if member.isreg():
                 extracted = tar.extractfile(member)
                 if extracted is not None:
-                    frames.append(pd.read_csv(extracted, sep='\t', header=None))
+                    data = extracted.read()
+                    buf.write(data)
+                    if data and not data.endswith(b'\n'):
+                        buf.write(b'\n')
 
-    if not frames:
+    if not buf.tell():
         logging.warning("No data found in FoldSeek results.")
         return pd.DataFrame()
 
-    return pd.concat(frames, ignore_index=True)
+    buf.seek(0)
+    return pd.read_csv(buf, sep='\t', header=None, usecols=RESULT_COLUMNS)
 
 def get_fold(pdb_data: str, pdb_file: str="converted_by_esmfold.pdb", db: str = 'afdb50',
             max_eval: float = 10, min_ident: float = 30.0, k_max: int = 10) -> list:
@@ -184,15 +238,21 @@ def get_fold(pdb_data: str, pdb_file: str="converted_by_esmfold.pdb", db: str =
     logging.info(f"FoldSeek job ID: {job_id}")
 
     poll_job(job_id)
-    results = download_results(job_id)
-    df = parse_results(results)
+    with download_results(job_id) as resp:
+        df = parse_results(resp.raw)
+
+    if df.empty:
+        return []
 
-    filtered = df[(df[10] <= max_eval) & (df[2] >= min_ident)]
-    filtered = filtered.sort_values(by=[10, 2], ascending=[True, False]).head(k_max)
+    # Filter and rank on the raw arrays, only the selected targets are materialised
+    evalues = df[10].to_numpy()
+    idents = df[2].to_numpy()
+    keep = np.flatnonzero((evalues <= max_eval) & (idents >= min_ident))
+    top = keep[np.lexsort((-idents[keep], evalues[keep]))][:k_max] # e-value asc, identity desc
 
-    fs_results = filtered[1].tolist()
+    fs_results = df[1].to_numpy()[top].tolist()
 
-    uniprot_ids = [re.search(r"AF-([A-Z0-9]+)-", entry).group(1) for entry in fs_results if "AF-" in entry]
+    uniprot_ids = [match.group(1) for entry in fs_results if (match := AF_ID_RE.search(entry))]
     logging.info(f"Filtered results: {len(uniprot_ids)} hits remain after filtering.")
     return uniprot_ids
 
@@ -217,7 +277,7 @@ if __name__ == "__main__":
         logging.error(f"Error reading FASTA file: {e}")
         sys.exit(1)
 
-    valid_dbs = [db for db in args.dbs if db in DBS]
+    valid_dbs = [db for db in dict.fromkeys(args.dbs) if db in DB_SET] # drop repeats, keep order
 
     if not valid_dbs:
         logging.warning(f"Invalid databases. Available options are: {', '.join(DBS)}.")
@@ -230,20 +290,25 @@ if __name__ == "__main__":
     all_results = []
     timestamp = int(time.time())
 
-    for db in valid_dbs:
-        try:
-            results = get_fold(
-                pdb_data=pdb_data,
-                pdb_file=pdb_file,
-                db=db,
-                max_eval=args.max_eval,
-                min_ident=args.min_ident,
-                k_max=args.kMax
-            )
-            #if results: print(results)
-            all_results.extend(results)
-        except Exception as e:
-            logging.error(f"Error during FoldSeek pipeline on DB '{db}': {e}")
+    # Each database is an independent remote job that mostly waits in poll_job, threads are enough
+    with ThreadPoolExecutor(max_workers=len(valid_dbs)) as executor:
+        futures = {executor.submit(
+                        get_fold,
+                        pdb_data=pdb_data,
+                        pdb_file=pdb_file,
+                        db=db,
+                        max_eval=args.max_eval,
+                        min_ident=args.min_ident,
+                        k_max=args.kMax
+                    ): db for db in valid_dbs}
+        for future in as_completed(futures):
+            db = futures[future]
+            try:
+                results = future.result()
+                #if results: print(results)
+                all_results.extend(results)
+            except Exception as e:
+                logging.error(f"Error during FoldSeek pipeline on DB '{db}': {e}")
 
     elapsed = int(time.time()) - timestamp
     logging.info(f"Elapsed: {format_time(elapsed)}")
@@ -1,18 +1,41 @@
-import urllib.request
-import urllib.error
-import xml.etree.ElementTree as ET
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
 import json
 import argparse
 import logging
 import sys
 import os
-import pandas as pd
+import time
+import csv
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from map_to_uniprot import process_id_file
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SCRIPT_DIR = os.path.dirname(BASE_DIR)
-BASE_URL = "http://rest.uniprot.org/uniprot/"
+BASE_URL = "https://rest.uniprot.org/uniprotkb/"
+ACCESSIONS_URL = "https://rest.uniprot.org/uniprotkb/accessions"
 EVIDENCE_MAPPING = f"{SCRIPT_DIR}/meta/go_evidence_map.csv"
+MAX_WORKERS = 16 # concurrent UniProt requests
+BATCH_SIZE = 100 # accessions per batch request
+CACHE_DIR = f"{SCRIPT_DIR}/.uniprot_cache"
+CACHE_MAX_AGE = 30 * 24 * 3600 # re-fetch cached entries older than 30 days
+CACHE_RELEASE_FILE = os.path.join(CACHE_DIR, "release")
+REQUEST_TIMEOUT = 30
+NOT_FOUND_CODE = 404 # unknown accession, the answer won't change before the next release
+# Only the accessions and GO cross-references are requested, a fraction of the full entry
+GO_FIELDS = "accession,go"
+
+# Shared session, worker threads reuse pooled keep-alive connections instead of a new TLS handshake per ID
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS,
+                       max_retries=Retry(total=5, backoff_factor=0.5,
+                                         status_forcelist=[429, 500, 502, 503, 504]))
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+atexit.register(SESSION.close)
 
 EVIDENCE_SCORES = {
     "IDA": 5,
@@ -33,71 +56,308 @@ EVIDENCE_SCORES = {
     "NR":  1,
     "ND":  0
 }
+DEFAULT_SCORE = EVIDENCE_SCORES["IEA"] # ECO codes missing from the mapping count as electronic annotation
 
-def get_go_terms(uniprot_id: str, evidence_map: dict) -> list[tuple]:
+@functools.lru_cache(maxsize=None)
+def load_eco_scores(evidence_map: str = EVIDENCE_MAPPING) -> dict:
+    """
+    Build the ECO code -> evidence score table once per mapping file.
+    The two-step ECO -> evidence -> score lookup is folded into a single dict.
+    """
+    with open(evidence_map, newline="") as f:
+        reader = csv.reader(f, delimiter="\t")
+        next(reader, None) # header: ECO_map, evidence
+        return {row[0]: EVIDENCE_SCORES.get(row[1].strip(), 0) for row in reader if len(row) >= 2}
 
-    xml_url = f'{BASE_URL}{uniprot_id}.xml'
+def load_cached_refs(uniprot_id: str, max_age: float | None = CACHE_MAX_AGE) -> list | None:
+    """
+    Load cached (GO ID, evidence code) pairs for a UniProt ID.
+    Returns None when the entry is missing, older than max_age (None disables the check) or unreadable.
+    """
+    cache_path = os.path.join(CACHE_DIR, f"{uniprot_id}.json")
     try:
-        with urllib.request.urlopen(xml_url) as response:
-            xml = response.read().decode('utf-8')
-    except urllib.error.HTTPError as e:
-        logging.error(f"Failed to retrieve GO data for {uniprot_id}: {e}")
-        return []
+        if max_age is not None and time.time() - os.path.getmtime(cache_path) > max_age:
+            return None
+        with open(cache_path, "r") as f:
+            return [tuple(ref) for ref in json.load(f)]
+    except (OSError, ValueError):
+        return None
 
+def load_stale_refs(uniprot_id: str) -> tuple[str, list] | None:
+    """
+    Load an expired cache entry together with the ETag it was served with,
+    so it can be revalidated with a conditional request instead of downloaded again.
+    Returns None if there is no entry or no ETag for it.
+    """
     try:
-        root = ET.fromstring(xml)
-        namespace = "{http://uniprot.org/uniprot}"
-
-        go_entries = []
-        for db_ref in root.findall(f".//{namespace}dbReference[@type='GO']"):
-            go_id = db_ref.get("id", "")
-            evidence_code = None
-
-            for prop in db_ref.findall(f"{namespace}property"):
-                if prop.attrib["type"] == "evidence":
-                    evidence_code = prop.attrib["value"]
-                #elif prop.attrib["type"] == "term":
-                #    term = prop.attrib["value"]
-            evidence = evidence_map.get(evidence_code, "IEA")
-            evidence_score = EVIDENCE_SCORES.get(evidence, 0)
-            go_entries.append((
-                go_id,
-                #term,   # 'P' (Process), 'F' (Function), 'C' (Component)
-                evidence_score
-            ))
-        return go_entries
+        with open(os.path.join(CACHE_DIR, f"{uniprot_id}.etag"), "r") as f:
+            etag = f.read().strip()
+    except OSError:
+        return None
+    go_refs = load_cached_refs(uniprot_id, max_age=None)
+    if not etag or go_refs is None:
+        return None
+    return etag, go_refs
 
-    except Exception as e:
-        logging.error(f"Failed to parse GO terms for {uniprot_id}: {e}")
-        return []
+def get_uniprot_release() -> str | None:
+    """
+    Ask UniProt for its current release (X-UniProt-Release header of a minimal query).
+    Returns None if UniProt could not be reached.
+    """
+    try:
+        response = SESSION.head(f"{BASE_URL}search", params={"query": "*", "size": 0},
+                                timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.headers.get("X-UniProt-Release")
+    except requests.RequestException as e:
+        logging.warning(f"Could not check the UniProt release: {e}")
+        return None
+
+def sync_cache_release() -> bool:
+    """
+    Drop cached GO data when UniProt published a new release since it was stored.
+    If the release can't be determined the cache is kept and only CACHE_MAX_AGE applies.
+    Returns True when every cached entry is known to come from the current release,
+    entries past CACHE_MAX_AGE are then still up to date.
+    """
+    release = get_uniprot_release()
+    if not release:
+        return False
+    try:
+        with open(CACHE_RELEASE_FILE, "r") as f:
+            cached_release = f.read().strip()
+    except OSError:
+        cached_release = None
+    if cached_release == release:
+        return True
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Entries cached before any release was recorded may be older, they are cleared as well
+        logging.info(f"UniProt release changed ({cached_release} -> {release}), clearing GO cache.")
+        for name in os.listdir(CACHE_DIR):
+            if name.endswith((".json", ".etag")):
+                os.remove(os.path.join(CACHE_DIR, name))
+        with open(CACHE_RELEASE_FILE, "w") as f:
+            f.write(release)
+    except OSError as e:
+        logging.warning(f"Failed to update the GO cache release: {e}")
+        return False
+    return True
+
+def save_cached_refs(uniprot_id: str, go_refs: list, etag: str | None = None):
+    """
+    Cache (GO ID, evidence code) pairs for a UniProt ID, with the response ETag when there is one.
+    """
+    cache_path = os.path.join(CACHE_DIR, f"{uniprot_id}.json")
+    etag_path = os.path.join(CACHE_DIR, f"{uniprot_id}.etag")
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, "w") as f:
+            json.dump(go_refs, f)
+        if etag:
+            with open(etag_path, "w") as f:
+                f.write(etag)
+        elif os.path.exists(etag_path):
+            os.remove(etag_path) # the old ETag no longer describes what is cached
+    except OSError as e:
+        logging.warning("Failed to cache GO data for %s: %s", uniprot_id, e)
+
+def fetch_go_refs(uniprot_id: str, stale: tuple[str, list] | None = None) -> tuple[list | None, str | None]:
+    """
+    Download the GO cross-references of a UniProt entry as (GO ID, evidence code) pairs.
+    With a stale (ETag, refs) cache entry the request is conditional, a 304 reuses the cached refs.
+    Unknown accessions (404) and ones UniProt rejects as malformed (400 naming the accession)
+    give an empty list, so they get cached like any entry. Other errors are not cached.
+    Returns (refs, ETag), refs is None if the entry could not be retrieved or parsed.
+    """
+    entry_url = f'{BASE_URL}{uniprot_id}.json'
+    headers = {"If-None-Match": stale[0]} if stale else None
+    try:
+        response = SESSION.get(entry_url, params={"fields": GO_FIELDS}, headers=headers,
+                               timeout=REQUEST_TIMEOUT)
+        if stale and response.status_code == 304:
+            return stale[1], stale[0]
+        if response.status_code == NOT_FOUND_CODE or (response.status_code == 400 and is_invalid_accession(response)):
+            logging.warning("UniProt has no entry for %s (HTTP %d).", uniprot_id, response.status_code)
+            return [], None
+        response.raise_for_status()
+        return extract_go_refs(response.json()), response.headers.get("ETag")
+    except requests.RequestException as e:
+        logging.error("Failed to retrieve GO data for %s: %s", uniprot_id, e)
+        return None, None
+    except (ValueError, KeyError, TypeError) as e:
+        logging.error("Failed to parse GO terms for %s: %s", uniprot_id, e)
+        return None, None
+
+def is_invalid_accession(response: requests.Response) -> bool:
+    """
+    Tell whether a 400 response is UniProt rejecting the accession itself, e.g.
+    "The 'accession' value has invalid format. It should be a valid UniProtKB accession".
+    Any other 400 (bad fields, gateway errors) says nothing about the entry.
+    """
+    try:
+        messages = response.json().get("messages", [])
+    except (ValueError, AttributeError):
+        return False
+    return any("accession" in msg.lower() and "invalid" in msg.lower()
+               for msg in messages if isinstance(msg, str))
+
+def extract_go_refs(entry: dict) -> list[tuple]:
+    """
+    Extract (GO ID, evidence code) pairs from a UniProt JSON entry.
+    """
+    go_refs = []
+    for db_ref in entry.get("uniProtKBCrossReferences", []):
+        if db_ref.get("database") != "GO":
+            continue
+        evidences = db_ref.get("evidences")
+        evidence_code = evidences[0].get("evidenceCode") if evidences else None
+        go_refs.append((db_ref["id"], evidence_code))
+    return go_refs
+
+def fetch_go_refs_batch(uniprot_ids: list) -> dict:
+    """
+    Download the GO cross-references of many UniProt entries with a single accessions request.
+    Returns {UniProt ID: [(GO ID, evidence code)]} for the IDs found in the response,
+    missing IDs are left for the caller to retry one by one.
+    """
+    params = {"accessions": ",".join(uniprot_ids), "fields": GO_FIELDS,
+              "format": "json", "size": len(uniprot_ids)}
+    try:
+        response = SESSION.get(ACCESSIONS_URL, params=params, timeout=REQUEST_TIMEOUT * 4)
+        response.raise_for_status()
+        entries = response.json().get("results", [])
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"Failed to retrieve GO data for a batch of {len(uniprot_ids)} IDs: {e}")
+        return {}
+
+    wanted = set(uniprot_ids)
+    go_refs = {}
+    for entry in entries:
+        refs = extract_go_refs(entry)
+        # Match primary and secondary accessions, IDs in the input may be either
+        accessions = [entry.get("primaryAccession"), *entry.get("secondaryAccessions", [])]
+        for accession in accessions:
+            if accession in wanted:
+                go_refs[accession] = refs
+    return go_refs
+
+def fetch_and_cache_batch(uniprot_ids: list) -> dict:
+    """
+    fetch_go_refs_batch plus the cache writes, so a pool worker handles parsing and disk I/O
+    for its own batch instead of funnelling them through the collecting thread.
+    """
+    go_refs = fetch_go_refs_batch(uniprot_ids)
+    for uniprot_id, refs in go_refs.items():
+        save_cached_refs(uniprot_id, refs)
+    return go_refs
+
+def revalidate_refs(uniprot_id: str, stale: tuple[str, list]) -> list | None:
+    """
+    Conditionally re-fetch an expired cache entry with its stored ETag and refresh the cache.
+    Returns the (GO ID, evidence code) pairs, or None if the request failed.
+    """
+    go_refs, etag = fetch_go_refs(uniprot_id, stale)
+    if go_refs is not None:
+        save_cached_refs(uniprot_id, go_refs, etag)
+    return go_refs
 
-def get_go_terms_batch(uniprot_ids: list, evidence_map: str = EVIDENCE_MAPPING) -> dict:
+def score_go_refs(go_refs: list, eco_scores: dict) -> list[tuple]:
+    """
+    Turn (GO ID, evidence code) pairs into (GO ID, evidence score) pairs.
+    eco_scores is the table from load_eco_scores.
+    """
+    return [(go_id, eco_scores.get(evidence_code, DEFAULT_SCORE)) for go_id, evidence_code in go_refs]
 
-    map_df = pd.read_csv(evidence_map, sep="\t")
-    map_dict = map_df.set_index("ECO_map")["evidence"].to_dict()
+def get_go_terms(uniprot_id: str, eco_scores: dict, use_cache: bool = True) -> list[tuple]:
+    """
+    Get (GO ID, evidence score) pairs for a UniProt ID.
+    Entries are cached on disk, so IDs seen in previous runs skip the network,
+    expired entries are revalidated with their ETag rather than downloaded again.
+    """
+    go_refs = load_cached_refs(uniprot_id) if use_cache else None
+
+    if go_refs is None:
+        stale = load_stale_refs(uniprot_id) if use_cache else None
+        go_refs, etag = fetch_go_refs(uniprot_id, stale)
+        if go_refs is None:
+            return []
+        if use_cache:
+            save_cached_refs(uniprot_id, go_refs, etag)
+
+    return score_go_refs(go_refs, eco_scores)
+
+def get_go_terms_batch(uniprot_ids: list, evidence_map: str = EVIDENCE_MAPPING,
+                       max_workers: int = MAX_WORKERS, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Retrieve GO terms for many UniProt IDs.
+    Uncached IDs are fetched with one accessions request per batch_size IDs, batches run
+    concurrently. IDs missing from a batch response fall back to single-entry requests.
+
+    Expired entries are revalidated in bulk against the UniProt release: entries only change
+    between releases, so while the release is unchanged they are reused as they are.
+    If the release can't be confirmed, expired entries that have an ETag are revalidated one
+    by one (a 304 costs only headers). Batch responses carry no per-entry ETag, so this
+    fallback only covers entries that were last fetched individually, the rest are re-downloaded.
+    """
+    eco_scores = load_eco_scores(evidence_map)
     uniprot_ids = list(set(uniprot_ids))
     go_terms = {}
 
+    if not uniprot_ids:
+        return go_terms
+
+    release_current = sync_cache_release()
+    go_refs = {}
+    stale = {}
     for uniprot_id in uniprot_ids:
-        go_terms[uniprot_id] = get_go_terms(uniprot_id, map_dict)
+        cached = load_cached_refs(uniprot_id, max_age=None if release_current else CACHE_MAX_AGE)
+        if cached is not None:
+            go_refs[uniprot_id] = cached
+        elif (stale_entry := load_stale_refs(uniprot_id)) is not None:
+            stale[uniprot_id] = stale_entry
+    missing = [uniprot_id for uniprot_id in uniprot_ids if uniprot_id not in go_refs and uniprot_id not in stale]
+
+    if stale:
+        logging.info(f"Revalidating {len(stale)} expired cache entries.")
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(stale))) as executor:
+            for uniprot_id, refs in zip(stale, executor.map(revalidate_refs, stale, stale.values())):
+                if refs is not None:
+                    go_refs[uniprot_id] = refs
+
+    if missing:
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            for batch_refs in executor.map(fetch_and_cache_batch, batches):
+                go_refs.update(batch_refs)
+
+    leftover = [uniprot_id for uniprot_id in uniprot_ids if uniprot_id not in go_refs]
+    if leftover:
+        logging.info(f"{len(leftover)} IDs not returned by batch queries, fetching them one by one.")
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(leftover))) as executor:
+            results = executor.map(lambda uniprot_id: get_go_terms(uniprot_id, eco_scores), leftover)
+            for uniprot_id, entries in zip(leftover, results):
+                go_terms[uniprot_id] = entries
+
+    for uniprot_id, refs in go_refs.items():
+        go_terms[uniprot_id] = score_go_refs(refs, eco_scores)
     return go_terms
 
 def validate_uniprot_ids(uniprot_ids: list) -> dict:
     """
     Validate UniProt IDs by checking if they return GO terms.
+    Goes through get_go_terms_batch, so IDs already cached are not fetched again.
     :param uniprot_ids: List of UniProt IDs.
     :return: Dictionary of valid IDs and their GO terms.
     """
     valid_ids = {}
-    for uniprot_id in uniprot_ids:
-        try:
-            go_terms = get_go_terms(uniprot_id)
-            if go_terms:
-                valid_ids[uniprot_id] = go_terms
-            else:
-                print(f"UniProt ID {uniprot_id} has no GO terms.")
-        except RuntimeError as e:
-            print(f"Error validating UniProt ID {uniprot_id}: {e}")
+    go_terms = get_go_terms_batch(uniprot_ids)
+    for uniprot_id in dict.fromkeys(uniprot_ids):
+        if go_terms.get(uniprot_id):
+            valid_ids[uniprot_id] = go_terms[uniprot_id]
+        else:
+            print(f"UniProt ID {uniprot_id} has no GO terms.")
     return valid_ids
 
 def load_uniprot_ids(file_path: str) -> list:
@@ -118,18 +378,17 @@ def save_go_terms(go_terms: dict, output_json: str, output_csv: str):
     :param output_file: Output file path.
     """
     try:
+        # json.dumps without indent runs the C encoder, json.dump always streams through the pure-Python one
         with open(output_json, "w") as f:
-            json.dump(go_terms, f, indent=4)
+            f.write(json.dumps(go_terms, separators=(",", ":")))
 
-    except Exception as E:
+    except Exception as e:
         logging.error(f"Failed to save GO terms to json: {e}")
         sys.exit(1)
 
     try:
         with open(output_csv, "w") as f:
-            for _, value in go_terms.items():
-                for val in value:
-                    f.write(f"{val[0]}\t{val[1]}\n")
+            f.write("".join(f"{go_id}\t{score}\n" for entries in go_terms.values() for go_id, score in entries))
 
     except Exception as e:
         logging.error(f"Failed to save GO terms to csv: {e}")
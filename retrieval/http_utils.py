@@ -0,0 +1,23 @@
+"""
+Small HTTP helpers shared by the web service clients.
+"""
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+def retry_after_seconds(response) -> float | None:
+    """
+    Read the Retry-After header (delta seconds or HTTP-date) of a response.
+    Returns None if the header is missing or unparsable.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
@@ -4,6 +4,8 @@ import requests
 import time
 import re
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,6 +17,8 @@ UNIPROT_BASE_URL = "https://rest.uniprot.org/idmapping"
 SUBMIT_URL = f"{UNIPROT_BASE_URL}/run"
 STATUS_URL = f"{UNIPROT_BASE_URL}/status"
 RESULTS_URL = f"{UNIPROT_BASE_URL}/results"
+MAX_IDS_PER_JOB = 5000 # larger ID lists are split into parallel mapping jobs
+POLL_START = 0.5       # first status poll interval (s), doubled up to poll_interval
 
 ID_TYPE_MAPPING = {
     "UniProtKB": r"^[A-NR-Z][0-9][A-Z0-9]{3}[0-9]$|^[OPQ][0-9][A-Z0-9]{3}[0-9]$|^A0A[A-Z0-9]{7}$",
@@ -22,16 +26,16 @@ ID_TYPE_MAPPING = {
     "PDB": r"^[0-9][A-Za-z0-9]{3}(_[A-Za-z0-9])?$",
     #"EMBL-GenBank-DDBJ": r"^[A-Z]{1,3}[0-9]{5,6}(\.[0-9]+)?$"
 }
+# One alternation with a named group per ID type, checked in ID_TYPE_MAPPING order by a single match
+CLASSIFY_RE = re.compile("|".join(f"(?P<{db_type}>{pattern})" for db_type, pattern in ID_TYPE_MAPPING.items()))
 
 def clean_pdb(pdb_id):
     """Remove chain info and ensure PDB ID is uppercased."""
     return pdb_id.split("_")[0].upper()
 
 def classify_id(id_str):
-    for db_type, pattern in ID_TYPE_MAPPING.items():
-        if re.match(pattern, id_str):
-            return db_type
-    return None
+    match = CLASSIFY_RE.match(id_str)
+    return match.lastgroup if match else None
 
 def extract_uniprot(status):
     uniprot_mapping = {}
@@ -61,11 +65,12 @@ def submit_mapping(ids, from_db, to_db="UniProtKB"):
 def check_mapping_status(job_id, max_retries=3, poll_interval=5, max_wait_time=200):
     """
     Check the status of the mapping job with retry logic and exponential backoff.
+    Polling starts at POLL_START seconds and doubles up to poll_interval, so short jobs return quickly.
 
     Args:
         job_id (str): The job ID returned by the mapping submission.
         max_retries (int): Maximum number of retries on failure.
-        poll_interval (int): Base interval (in seconds) between status checks.
+        poll_interval (int): Maximum interval (in seconds) between status checks.
         max_wait_time (int): Maximum time (in seconds) to wait for job completion.
 
     Returns:
@@ -73,6 +78,7 @@ def check_mapping_status(job_id, max_retries=3, poll_interval=5, max_wait_time=2
     """
     start_time = time.time()
     retry_cnt = 0
+    polls = 0
 
     while True:
         try:
@@ -91,7 +97,8 @@ def check_mapping_status(job_id, max_retries=3, poll_interval=5, max_wait_time=2
                     logging.error(f"Mapping job timed out after waiting {max_wait_time} seconds.")
                     return None
 
-                time.sleep(poll_interval)
+                time.sleep(min(poll_interval, POLL_START * 2 ** polls))
+                polls += 1
                 continue
 
             else:
@@ -122,42 +129,57 @@ def get_mapping_results(job_id):
         return None
     return response.json()
 
+def submit_and_wait(source_db, ids):
+    """
+    Run one mapping job for IDs of a single source DB.
+    Returns the {id: UniProt ID} mapping, an empty dict if the job timed out
+    or None if it could not be submitted.
+    """
+    job_id = submit_mapping(ids, source_db, "UniProtKB")
+    if not job_id:
+        return None
+    status = check_mapping_status(job_id)
+    return extract_uniprot(status) if status else {}
+
 def map_ids_to_uniprot(mixed_ids):
-    classified_ids =  {}
     final_mapping = {}
 
-    # 1️) Classify IDs by their type (RefSeq, PDB, UniProt, etc.)
-    for id in mixed_ids:
-        id_clean = id.strip()
+    if not mixed_ids:
+        return final_mapping
+
+    # 1️) Classify IDs by their type (RefSeq, PDB, UniProt, etc.), one compiled-regex match per ID
+    classified_ids = defaultdict(list)
+    for id_str in mixed_ids:
+        id_clean = id_str.strip()
         id_type = classify_id(id_clean)
+        if id_type is None:
+            logging.warning(f"Could not classify ID: {id_clean}")
+            final_mapping[id_clean] = None
+            continue
         if id_type == "PDB":
             id_clean = clean_pdb(id_clean)
+        classified_ids[id_type].append(id_clean)
 
-        if not id_type:
-            logging.warning(f"Could not classify ID: {id_clean}")
-            final_mapping[id_clean] = None
-        else:
-            classified_ids.setdefault(id_type, []).append(id_clean)
+    # 2) UniProt IDs need no mapping
+    for uid in classified_ids.pop("UniProtKB", []):
+        final_mapping[uid] = uid
 
-    # 2) Process each ID type
+    # 3) Submit all mapping jobs at once, they are polled concurrently
+    jobs = []
     for source_db, ids in classified_ids.items():
-        if source_db == "UniProtKB":
-            # No mapping needed
-            for uid in ids:
-                final_mapping[uid] = uid
-            continue
-
+        ids = list(dict.fromkeys(ids))
         logging.info(f"Mapping {len(ids)} IDs from {source_db} to UniProtKB...")
-        job_id = submit_mapping(list(set(ids)), source_db, "UniProtKB")
-
-        if job_id:
-            status = check_mapping_status(job_id)
-            if status:
-                uniprot_mapping = extract_uniprot(status)
+        jobs.extend((source_db, ids[i:i + MAX_IDS_PER_JOB]) for i in range(0, len(ids), MAX_IDS_PER_JOB))
+
+    if jobs:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            futures = {executor.submit(submit_and_wait, source_db, ids): source_db for source_db, ids in jobs}
+            for future in as_completed(futures):
+                uniprot_mapping = future.result()
+                if uniprot_mapping is None:
+                    logging.error(f"Mapping failed for {futures[future]} ID")
+                    continue
                 final_mapping.update(uniprot_mapping)
-        else:
-            logging.error(f"Mapping failed for {source_db} ID")
-            continue
 
     return final_mapping
 
@@ -166,18 +188,18 @@ def process_id_file(input_file: str) -> list:
 
     try:
         with open(input_file, 'r') as f:
-            mixed_ids = list(set([line.strip() for line in f if line.strip()]))
+            # IDs never contain whitespace, so one C-level split replaces the per-line strip
+            mixed_ids = list(set(f.read().split()))
 
         if not mixed_ids:
             logging.error("Protein IDs file is empty.")
             sys.exit(1)
 
         mapping = map_ids_to_uniprot(mixed_ids)
-        uniprot_ids = sorted(set(uid for uid in mapping.values() if uid))
+        uniprot_ids = sorted({uid for uid in mapping.values() if uid})
 
         with open(input_file, 'w') as f:
-            for uid in uniprot_ids:
-                f.write(f"{uid}\n")
+            f.writelines(f"{uid}\n" for uid in uniprot_ids)
 
         if uniprot_ids:
             logging.info(f"{len(uniprot_ids)} IDs successfully mapped to UniProt IDs")
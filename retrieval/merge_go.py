@@ -9,6 +9,7 @@ import json
 import sys
 import pandas as pd
 import logging
+from collections import ChainMap
 from pathlib import Path
 
 logging.basicConfig(
@@ -43,14 +44,18 @@ def load_csv(file_path):
         sys.exit(1)
 
     try:
-        terms_with_score = pd.read_csv(file_path, sep='\t')
+        # Written by get_go_terms.py / get_elm.py without a header row
+        terms_with_score = pd.read_csv(file_path, sep='\t', header=None)
         if terms_with_score.empty:
             return []
 
         if terms_with_score.shape[1] != 2:
-            logging.error(f"GO - score file must have two columns: {file_path}\n{e}")
+            logging.error(f"GO - score file must have two columns: {file_path}")
             sys.exit(1)
 
+    except pd.errors.EmptyDataError:
+        return []
+
     except Exception as e:
         logging.error(f"Failed to load GO - score file: {file_path}\n{e}")
         sys.exit(1)
@@ -58,30 +63,38 @@ def load_csv(file_path):
     return terms_with_score
 
 def merge_dicts(fs_data, elm_data):
-    merged = elm_data.copy()
-    merged.update(fs_data) # Add/replace with FoldSeek
-    return merged
+    """
+    Merged read-only view of both GO dicts, FoldSeek entries take precedence.
+    """
+    return ChainMap(fs_data, elm_data)
+
+def write_json(mapping, out):
+    """
+    Write a mapping as a single JSON object, one entry at a time.
+    Each entry is encoded on its own with json.dumps, which uses the C encoder.
+    """
+    out.write("{")
+    out.writelines(f"{',' if i else ''}{json.dumps(key)}:{json.dumps(value, separators=(',', ':'))}"
+                   for i, (key, value) in enumerate(mapping.items()))
+    out.write("}")
 
 def merge_csv(fs_data, elm_data):
-    if fs_data.empty and elm_data.empty:
+    """
+    Merge two GO - score tables in one pass, the first table wins for GO terms in both.
+    """
+    if len(fs_data) == 0 and len(elm_data) == 0:
         logging.error(f"Both .csv files are empty: {fs_data}--{elm_data}")
         return []
-    if fs_data.empty:
-        return elm_data
-    if elm_data.empty:
-        return fs_data
 
     try:
-        fs_data = fs_data.reset_index(drop=True)
-        elm_data = elm_data.reset_index(drop=True)
-
-        fs_data.columns = ['GO_term', 'score']
-        elm_data.columns = ['GO_term', 'score']
-
-        merged_df = pd.concat([fs_data, elm_data], ignore_index=True)
+        merged = {}
+        for data in (fs_data, elm_data):
+            if len(data) == 0:
+                continue
+            for term, score in zip(data.iloc[:, 0].tolist(), data.iloc[:, 1].tolist()):
+                merged.setdefault(term, score)
 
-        merged_df = merged_df.drop_duplicates(subset='GO_term', keep='first')
-        return merged_df
+        return pd.DataFrame(list(merged.items()), columns=['GO_term', 'score'])
 
     except Exception as e:
         logging.error(f"Failed to merge csv files: {e}")
@@ -107,7 +120,7 @@ def main():
 
     try:
         with open(args.output_json, 'w') as out:
-            json.dump(merged_dict, out, indent=2)
+            write_json(merged_dict, out)
         merged_df.to_csv(args.output_csv, sep='\t', index=False)
         print("[INFO] Merge completed successfully.")
     except Exception as e:
@@ -2,6 +2,8 @@ import argparse
 import sys
 import os
 import logging
+import mmap
+import re
 from pathlib import Path
 
 logging.basicConfig(
@@ -10,10 +12,22 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S"
 )
 
+LINE_RE = re.compile(rb"[^\r\n]+")
+
 def file_nonempty(file_path: str) -> bool:
     path = Path(file_path)
     return path.is_file() and os.path.getsize(path) > 0
 
+def load_ids(file_path: str) -> set:
+    """
+    Load the non-empty, stripped lines of a non-empty file as a set of bytes.
+    The file is memory-mapped and tokenised by one regex scan, nothing is decoded.
+    """
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        ids = {line.strip() for line in LINE_RE.findall(buf)}
+    ids.discard(b"")
+    return ids
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Unify 2 results into a single file."
@@ -36,26 +50,17 @@ if __name__ == "__main__":
     unique_ids = set()
 
     if local_exists:
-        with open(args.local_file, 'r') as local:
-            for line in local:
-                line = line.strip()
-                if line:
-                    unique_ids.add(line)
+        unique_ids |= load_ids(args.local_file)
 
     if api_exists:
-        with open(args.api_file, 'r') as api:
-            for line in api:
-                line = line.strip()
-                if line:
-                    unique_ids.add(line)
+        unique_ids |= load_ids(args.api_file)
 
     if not unique_ids:
         logging.error("No IDs found in results files")
         sys.exit(1)
 
-    with open(args.output_file, 'w') as outf:
-        for id in sorted(unique_ids):
-            outf.write(id + '\n')
+    with open(args.output_file, 'wb') as outf:
+        outf.writelines(uid + b'\n' for uid in sorted(unique_ids))
 
     if not file_nonempty(args.output_file):
         logging.error(f"[ERROR] Output file {args.output_file} was not created or is empty.")